@@ -1,38 +1,104 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
+import contextlib
 import csv
-import fileinput
+import functools
 import gzip
+import io
+import multiprocessing
 import os
-import shutil
+import re
+import struct
 import subprocess
 import sys
-import tempfile
 import zipfile
-from typing import Dict, IO, List, Optional
-
-
-def matches_filter_types(activity: Dict, filter_types: Optional[List]) -> bool:
+import zlib
+from typing import (
+    Callable,
+    Dict,
+    IO,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+try:
+    import fitparse  # type: ignore
+except ImportError:
+    # Without fitparse, fit files are converted with gpsbabel
+    fitparse = None
+
+
+class Activity(NamedTuple):
+    id: str
+    date: str
+    type: str
+    filename: str
+
+
+def matches_filter_types(activity: Activity, filter_types: Optional[List]) -> bool:
     if not filter_types:
         return True
-    activity_type = activity["type"].lower()
+    activity_type = activity.type.lower()
     for filter_type in filter_types:
         if filter_type.lower() == activity_type:
             return True
     return False
 
 
-def matches_filter_years(activity: Dict, filter_years: Optional[List]) -> bool:
+# The first four digits of an activity date are its year, in both the current
+# ("Jan 5, 2019, 10:00:00 AM") and the older ("2019-01-05 10:00:00") format
+YEAR = re.compile(r"\d{4}")
+
+
+def get_activity_year(activity: Activity) -> str:
+    match = YEAR.search(activity.date)
+    return match.group() if match else ""
+
+
+def matches_filter_years(activity: Activity, filter_years: Optional[List]) -> bool:
     if not filter_years:
         return True
-    activity_year = activity["date"][0:4]
+    activity_year = get_activity_year(activity)
     if activity_year in filter_years:
         return True
     return False
 
 
-GPSBABEL_FILE_TYPE = {"fit": "garmin_fit", "tcx": "gtrnctr"}
+GPSBABEL_FILE_TYPE = {"fit": "garmin_fit"}
+
+# Maximum number of conversions passed to a single gpsbabel invocation, keeps
+# the command line well below ARG_MAX
+GPSBABEL_BATCH_SIZE = 200
+
+# Buffer size used when copying activity data
+COPY_BUFFER_SIZE = 1 << 20
+
+# Buffer reused for all copies instead of allocating one per read, each worker
+# process has its own
+copy_buffer = memoryview(bytearray(COPY_BUFFER_SIZE))
+
+
+def copy_stream(source_file_obj: IO[bytes], target_file_obj: IO[bytes]):
+    readinto = cast(io.BufferedIOBase, source_file_obj).readinto
+    while True:
+        length = readinto(copy_buffer)
+        if not length:
+            break
+        target_file_obj.write(copy_buffer[:length])
+
+
+# (file type, input file path, output file path) of a pending gpsbabel conversion
+GpsbabelJob = Tuple[str, str, str]
 
 
 def gpsbabel_convert(input_file_path: str, output_file_path: str, file_type: str):
@@ -51,52 +117,388 @@ def gpsbabel_convert(input_file_path: str, output_file_path: str, file_type: str
     )
 
 
-def strip_whitespaces_from_file(input_file_path: str):
-    with fileinput.FileInput(files=(input_file_path,), inplace=True) as fp:
-        for line in fp:
-            print(line.strip())
+def gpsbabel_convert_stream(
+    input_file_obj: IO[bytes], output_file_path: str, file_type: str
+):
+    process = subprocess.Popen(
+        [
+            "gpsbabel",
+            "-i",
+            GPSBABEL_FILE_TYPE[file_type],
+            "-f",
+            "-",
+            "-o",
+            "gpx",
+            "-F",
+            output_file_path,
+        ],
+        stdin=subprocess.PIPE,
+        bufsize=COPY_BUFFER_SIZE,
+    )
+    try:
+        with cast(IO, process.stdin) as gpsbabel_input:
+            copy_stream(input_file_obj, gpsbabel_input)
+    except BrokenPipeError:
+        # gpsbabel stopped reading early, it reports the problem itself
+        pass
+    process.wait()
+
+
+def gpsbabel_batch_convert(file_type: str, file_paths: List[Tuple[str, str]]):
+    command = ["gpsbabel", "-i", GPSBABEL_FILE_TYPE[file_type], "-o", "gpx"]
+    for input_file_path, output_file_path in file_paths:
+        # gpsbabel accumulates everything it reads, so drop the data of the
+        # previous file after writing it
+        command += ["-f", input_file_path, "-F", output_file_path]
+        command += ["-x", "nuke,waypoints,tracks,routes"]
+    try:
+        returncode = subprocess.run(command).returncode
+    except OSError as error:
+        # gpsbabel could not be run at all, none of these can be converted
+        for input_file_path, _ in file_paths:
+            print(f"Could not convert {input_file_path}: {error!r}\n")
+        return
+    if returncode != 0:
+        for input_file_path, output_file_path in file_paths:
+            gpsbabel_convert(input_file_path, output_file_path, file_type)
+
+
+class ZipEntryReader(io.RawIOBase):
+    # Reads a stored or deflated zip entry with positioned reads of the archive,
+    # so there is no seek/read dance on the shared archive file object, and
+    # inflates it chunk by chunk, so memory use does not grow with the entry size
+
+    def __init__(self, fd: int, zip_info: zipfile.ZipInfo, data_offset: int):
+        self._fd = fd
+        self._zip_info = zip_info
+        self._offset = data_offset
+        self._remaining = zip_info.compress_size
+        self._pending = b""
+        self._decompressor = (
+            zlib.decompressobj(-15)
+            if zip_info.compress_type == zipfile.ZIP_DEFLATED
+            else None
+        )
+        self._crc = 0
+
+    def readable(self) -> bool:
+        return True
 
+    def _read_compressed(self) -> bytes:
+        data = os.pread(self._fd, min(COPY_BUFFER_SIZE, self._remaining), self._offset)
+        if not data:
+            raise zipfile.BadZipFile(f"Truncated entry {self._zip_info.filename}")
+        self._offset += len(data)
+        self._remaining -= len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        size = len(buffer)
+        data = b""
+        while not data and (self._pending or self._remaining):
+            if not self._pending:
+                self._pending = self._read_compressed()
+            if self._decompressor:
+                data = self._decompressor.decompress(self._pending, size)
+                self._pending = self._decompressor.unconsumed_tail
+            else:
+                data = self._pending[:size]
+                self._pending = self._pending[size:]
+        if not data and self._decompressor and not self._decompressor.eof:
+            # All input is used up, but the output may have been held back by the
+            # size limit
+            data = self._decompressor.decompress(b"", size)
+            if not data:
+                raise zipfile.BadZipFile(f"Truncated entry {self._zip_info.filename}")
+        if not data:
+            if self._crc != self._zip_info.CRC:
+                raise zipfile.BadZipFile(f"Bad CRC-32 for {self._zip_info.filename}")
+            return 0
+        self._crc = zlib.crc32(data, self._crc)
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def read_zip_entry(zip_file: zipfile.ZipFile, file_name: str) -> IO[bytes]:
+    zip_info = zip_file.getinfo(file_name)
+    if (
+        sys.platform == "win32"
+        or zip_info.flag_bits & 0x1
+        or zip_info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+    ):
+        return zip_file.open(zip_info)
+
+    fd = cast(IO[bytes], zip_file.fp).fileno()
+    header = os.pread(fd, 30, zip_info.header_offset)
+    if header[0:4] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"Bad local file header for {file_name}")
+    file_name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return cast(
+        IO[bytes],
+        io.BufferedReader(
+            ZipEntryReader(
+                fd,
+                zip_info,
+                zip_info.header_offset + 30 + file_name_length + extra_length,
+            )
+        ),
+    )
 
-def gunzip(gzip_file_name: str, target_file_obj: IO):
-    with gzip.open(gzip_file_name, "rb") as gzip_file:
-        shutil.copyfileobj(gzip_file, target_file_obj)
-        target_file_obj.flush()
 
+@contextlib.contextmanager
+def open_activity_stream(
+    zip_file: Optional[zipfile.ZipFile], file_name: str
+) -> Iterator[IO[bytes]]:
+    with (
+        read_zip_entry(zip_file, file_name) if zip_file else open(file_name, "rb")
+    ) as fp:
+        if file_name.endswith(".gz"):
+            with gzip.GzipFile(fileobj=fp) as gzip_file:
+                yield cast(IO[bytes], gzip_file)
+        else:
+            yield fp
+
+
+@contextlib.contextmanager
+def create_gpx_file(
+    target_gpx_file_name: str, mode: str, encoding: Optional[str] = None
+) -> Iterator[IO]:
+    # GPX files are written while the activity is still being read, so write to a
+    # temporary file and only rename it once complete, to not leave half a GPX
+    # file behind on errors
+    partial_gpx_file_name = target_gpx_file_name + ".part"
+    try:
+        with open(partial_gpx_file_name, mode, encoding=encoding) as gpx_file:
+            yield gpx_file
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(partial_gpx_file_name)
+        raise
+    os.replace(partial_gpx_file_name, target_gpx_file_name)
+
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="strava2gpx">'
+    "<trk><trkseg>\n"
+)
+GPX_FOOTER = "</trkseg></trk></gpx>\n"
+
+# (latitude, longitude, elevation, time) of a GPX track point, already as
+# XML-safe text
+TrackPoint = Tuple[str, str, Optional[str], Optional[str]]
+
+
+def write_gpx_file(track_points: Iterable[TrackPoint], target_gpx_file_name: str):
+    # Write the track points as they come, so the whole track is never in memory,
+    # and as plain text, which needs no objects per point besides the string
+    with create_gpx_file(target_gpx_file_name, "w", encoding="utf-8") as gpx_file:
+        write = gpx_file.write
+        write(GPX_HEADER)
+        for latitude, longitude, elevation, time in track_points:
+            write(
+                f'<trkpt lat="{latitude}" lon="{longitude}">'
+                + ("" if elevation is None else f"<ele>{elevation}</ele>")
+                + ("" if time is None else f"<time>{time}</time>")
+                + "</trkpt>\n"
+            )
+        write(GPX_FOOTER)
+
+
+SEMICIRCLES_TO_DEGREES = 180.0 / (1 << 31)
+
+
+def semicircles_to_degrees(semicircles: int) -> float:
+    return semicircles * SEMICIRCLES_TO_DEGREES
+
+
+def get_fit_track_points(fit_file: IO[bytes]) -> Iterator[TrackPoint]:
+    # This runs for every record, avoid the global lookups in the loop
+    to_degrees = semicircles_to_degrees
+    for record in fitparse.FitFile(fit_file).get_messages("record"):
+        values = record.get_values()
+        latitude = values.get("position_lat")
+        longitude = values.get("position_long")
+        if latitude is None or longitude is None:
+            continue
+        # enhanced_altitude is present but None in files without it
+        altitude = values.get("enhanced_altitude")
+        if altitude is None:
+            altitude = values.get("altitude")
+        timestamp = values.get("timestamp")
+        yield (
+            f"{to_degrees(latitude):.9f}",
+            f"{to_degrees(longitude):.9f}",
+            None if altitude is None else f"{altitude:.3f}",
+            # fit timestamps are whole seconds in UTC
+            None if timestamp is None else timestamp.isoformat() + "Z",
+        )
+
+
+def convert_fit_data(
+    fit_data: bytes, activity_file_name: str, target_gpx_file_name: str
+):
+    try:
+        write_gpx_file(get_fit_track_points(io.BytesIO(fit_data)), target_gpx_file_name)
+    except fitparse.FitParseError as error:
+        # Leave fit files that fitparse cannot handle to gpsbabel
+        try:
+            gpsbabel_convert_stream(io.BytesIO(fit_data), target_gpx_file_name, "fit")
+        except OSError:
+            print(
+                f"Could not convert {activity_file_name}: {error}, "
+                "and gpsbabel is not available to try instead.\n"
+            )
 
-def zip_extract(zip_file: zipfile.ZipFile, file_name: str, target_file_obj: IO):
-    with zip_file.open(file_name) as fp:
-        shutil.copyfileobj(fp, target_file_obj)
-        target_file_obj.flush()
 
+TCX_NAMESPACE = "http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2"
+TCX_TRACK_TAG = f"{{{TCX_NAMESPACE}}}Track"
+TCX_TRACKPOINT_TAG = f"{{{TCX_NAMESPACE}}}Trackpoint"
+TCX_TIME_PATH = f"{{{TCX_NAMESPACE}}}Time"
+TCX_LATITUDE_PATH = f"{{{TCX_NAMESPACE}}}Position/{{{TCX_NAMESPACE}}}LatitudeDegrees"
+TCX_LONGITUDE_PATH = f"{{{TCX_NAMESPACE}}}Position/{{{TCX_NAMESPACE}}}LongitudeDegrees"
+TCX_ALTITUDE_PATH = f"{{{TCX_NAMESPACE}}}AltitudeMeters"
+
+
+def get_tcx_text(element: ElementTree.Element, path: str) -> Optional[str]:
+    text = element.findtext(path)
+    return text.strip() if text else None
 
-def convert_activity(activity_file_name: str, target_gpx_file_name: str):
-    if (
-        activity_file_name.endswith(".fit.gz")
-        or activity_file_name.endswith(".tcx.gz")
-        or activity_file_name.endswith(".gpx.gz")
-    ):
-        suffix = activity_file_name[-7:-3]
-        with tempfile.NamedTemporaryFile(suffix=suffix) as gunzipped_file:
-            gunzip(activity_file_name, gunzipped_file)
-            gunzipped_file.flush()
-            convert_activity(gunzipped_file.name, target_gpx_file_name)
-
-    elif activity_file_name.endswith(".fit"):
-        gpsbabel_convert(activity_file_name, target_gpx_file_name, "fit")
-
-    elif activity_file_name.endswith(".tcx"):
-        with tempfile.NamedTemporaryFile() as tcx_file:
-            # As gpsbabel does not support tcx files with trailing spaces, remove them
-            shutil.copyfile(activity_file_name, str(tcx_file))
-            tcx_file.flush()
-            strip_whitespaces_from_file(tcx_file.name)
-            gpsbabel_convert(tcx_file.name, target_gpx_file_name, "tcx")
-
-    elif activity_file_name.endswith(".gpx"):
-        shutil.copyfile(activity_file_name, target_gpx_file_name)
 
+def get_tcx_track_points(tcx_file: IO[bytes]) -> Iterator[TrackPoint]:
+    # Parse the tcx file in a single pass while reading it, and drop every track
+    # point once it is used, so the document is never fully in memory
+    parser: ElementTree.XMLPullParser = ElementTree.XMLPullParser(
+        events=("start", "end")
+    )
+    track: Optional[ElementTree.Element] = None
+    # Strava tcx files may have whitespace in front of the XML declaration
+    data = tcx_file.read(COPY_BUFFER_SIZE).lstrip()
+    while data:
+        parser.feed(data)
+        for event, element in cast(
+            Iterator[Tuple[str, ElementTree.Element]], parser.read_events()
+        ):
+            if event == "start":
+                if element.tag == TCX_TRACK_TAG:
+                    track = element
+                continue
+            if element.tag != TCX_TRACKPOINT_TAG:
+                continue
+            latitude = get_tcx_text(element, TCX_LATITUDE_PATH)
+            longitude = get_tcx_text(element, TCX_LONGITUDE_PATH)
+            if latitude is not None and longitude is not None:
+                altitude = get_tcx_text(element, TCX_ALTITUDE_PATH)
+                time = get_tcx_text(element, TCX_TIME_PATH)
+                yield (
+                    f"{float(latitude):.9f}",
+                    f"{float(longitude):.9f}",
+                    None if altitude is None else f"{float(altitude):.3f}",
+                    None if time is None else escape(time),
+                )
+            if track is not None:
+                track.remove(element)
+        data = tcx_file.read(COPY_BUFFER_SIZE)
+    parser.close()
+
+
+def convert_fit_activity(
+    zip_file: Optional[zipfile.ZipFile],
+    activity_file_name: str,
+    target_gpx_file_name: str,
+) -> Optional[GpsbabelJob]:
+    if fitparse:
+        with open_activity_stream(zip_file, activity_file_name) as fit_file:
+            convert_fit_data(fit_file.read(), activity_file_name, target_gpx_file_name)
+    elif not zip_file and not activity_file_name.endswith(".gz"):
+        # gpsbabel can read this one directly, leave it to a batch
+        return ("fit", activity_file_name, target_gpx_file_name)
     else:
+        with open_activity_stream(zip_file, activity_file_name) as fit_file:
+            gpsbabel_convert_stream(fit_file, target_gpx_file_name, "fit")
+    return None
+
+
+def convert_tcx_activity(
+    zip_file: Optional[zipfile.ZipFile],
+    activity_file_name: str,
+    target_gpx_file_name: str,
+):
+    with open_activity_stream(zip_file, activity_file_name) as tcx_file:
+        try:
+            write_gpx_file(get_tcx_track_points(tcx_file), target_gpx_file_name)
+        except (ElementTree.ParseError, ValueError) as error:
+            print(f"Could not parse {activity_file_name}: {error}\n")
+
+
+def convert_gpx_activity(
+    zip_file: Optional[zipfile.ZipFile],
+    activity_file_name: str,
+    target_gpx_file_name: str,
+):
+    with open_activity_stream(
+        zip_file, activity_file_name
+    ) as gpx_file, create_gpx_file(target_gpx_file_name, "wb") as target_gpx_file:
+        copy_stream(gpx_file, target_gpx_file)
+
+
+# Converters by activity file extension. They stream the activity data from the
+# export (gunzipped on the fly) straight into its consumer, without any copies
+ACTIVITY_CONVERTERS: Dict[
+    str, Callable[[Optional[zipfile.ZipFile], str, str], Optional[GpsbabelJob]]
+] = {
+    ".fit": convert_fit_activity,
+    ".tcx": convert_tcx_activity,
+    ".gpx": convert_gpx_activity,
+}
+
+
+def prepare_activity(
+    zip_file: Optional[zipfile.ZipFile],
+    activity_file_name: str,
+    target_gpx_file_name: str,
+) -> Optional[GpsbabelJob]:
+    base_name, extension = os.path.splitext(activity_file_name)
+    if extension == ".gz":
+        extension = os.path.splitext(base_name)[1]
+    converter = ACTIVITY_CONVERTERS.get(extension)
+    if not converter:
         print(f"Unrecognized/unsupported file format: {activity_file_name}\n")
+        return None
+    return converter(zip_file, activity_file_name, target_gpx_file_name)
+
+
+worker_zip_file: Optional[zipfile.ZipFile] = None
+
+
+def init_worker(zip_file_name: Optional[str]):
+    # ZipFile objects cannot be shared between processes, so every worker opens
+    # the export once and keeps it for all the activities it converts
+    global worker_zip_file
+    if zip_file_name:
+        worker_zip_file = zipfile.ZipFile(zip_file_name, "r")
+
+
+def prepare_export_activity(
+    activity_file_name: str, gpx_file_path: str, verbose: bool
+) -> Optional[GpsbabelJob]:
+    if verbose:
+        print(f"Converting {activity_file_name} to {gpx_file_path}.")
+    try:
+        return prepare_activity(worker_zip_file, activity_file_name, gpx_file_path)
+    except Exception as error:
+        # Report the failure here, so it does not take down the other
+        # activities converted by this worker or the whole run
+        print(f"Could not convert {activity_file_name}: {error!r}\n")
+        return None
+
+
+def list_file_names(dir_name: str) -> Set[str]:
+    try:
+        with os.scandir(dir_name) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return set()
 
 
 def print_usage_error(args_parser: argparse.ArgumentParser, message: str):
@@ -105,37 +507,42 @@ def print_usage_error(args_parser: argparse.ArgumentParser, message: str):
     sys.exit(2)
 
 
+# Columns of the activities CSV file that are used, the file name is always last
+ID_COLUMN = 0
+DATE_COLUMN = 1
+TYPE_COLUMN = 3
+
+
 def get_activities(
     zip_file: Optional[zipfile.ZipFile], csv_file_name: str
-) -> List[Dict]:
-    if zip_file:
-        with tempfile.NamedTemporaryFile(suffix=".csv") as unzipped_file:
-            zip_extract(zip_file, csv_file_name, unzipped_file)
-            return get_activities(None, unzipped_file.name)
-    with open(csv_file_name) as csv_file:
-        activities = list(csv.DictReader(csv_file))
-        if len(activities) == 0:
-            return []
-
-        keys = list(activities[0].keys())
-        if len(keys) != 10 and len(keys) != 11:
+) -> Iterator[Activity]:
+    # Read the CSV straight from the export, there is no need to extract it
+    with (
+        io.TextIOWrapper(zip_file.open(csv_file_name))
+        if zip_file
+        else open(csv_file_name)
+    ) as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        if len(header) != 10 and len(header) != 11:
             raise Exception(
-                f"Unexpected header items in activities CSV file (expeciting 10 or 11 items): {list(keys)}"
+                f"Unexpected header items in activities CSV file (expeciting 10 or 11 items): {header}"
             )
 
-        id_field = keys[0]
-        date_field = keys[1]
-        type_field = keys[3]
-        filename_field = keys[-1]
-        return [
-            {
-                "id": a[id_field],
-                "type": a[type_field],
-                "date": a[date_field],
-                "filename": a[filename_field],
-            }
-            for a in activities
-        ]
+        filename_column = len(header) - 1
+        for row in reader:
+            if len(row) <= TYPE_COLUMN:
+                # Blank line, csv.reader does not skip those
+                continue
+            if len(row) <= filename_column:
+                # Short row without a file name, like the padding DictReader did
+                row = row + [""] * (filename_column + 1 - len(row))
+            yield Activity(
+                row[ID_COLUMN], row[DATE_COLUMN], row[TYPE_COLUMN], row[filename_column]
+            )
 
 
 def main():
@@ -205,14 +612,7 @@ def main():
             )
         print(f"Activity types found in {args.strava_export}:")
         for activity_type in sorted(
-            list(
-                set(
-                    [
-                        activity["type"]
-                        for activity in get_activities(zip_file, activities_csv)
-                    ]
-                )
-            )
+            {activity.type for activity in get_activities(zip_file, activities_csv)}
         ):
             print(f"- {activity_type}")
     else:
@@ -223,45 +623,95 @@ def main():
             )
         os.makedirs(args.output_dir, exist_ok=True)
 
-        for activity in get_activities(zip_file, activities_csv):
-            activity_file_name = activity["filename"]
+        # Both directories stay the same for all activities, join them only once
+        activity_dir_prefix = "" if zip_file else os.path.join(args.strava_export, "")
+        output_dir_prefix = os.path.join(args.output_dir, "")
+
+        # Look up activity files in listings of the export instead of letting
+        # each conversion find out that a file is missing
+        zip_file_names = set(zip_file.namelist()) if zip_file else set()
+        export_dir_file_names: Dict[str, Set[str]] = {}
 
-            if not activity_file_name:
+        activity_file_names = []
+        gpx_file_paths = []
+        for activity in get_activities(zip_file, activities_csv):
+            if not activity.filename:
                 continue
 
-            if not zip_file:
-                activity_file_name = os.path.join(
-                    args.strava_export, activity_file_name
-                )
+            activity_file_name = activity_dir_prefix + activity.filename
+
+            if not matches_filter_types(activity, args.filter_types):
+                if args.verbose:
+                    print(f"Skipping {activity_file_name}, type={activity.type}.")
+                continue
 
             if not matches_filter_years(activity, args.filter_years):
                 if args.verbose:
                     print(
-                        f'Skipping {activity_file_name}, year={activity["date"][0:4]}.'
+                        f"Skipping {activity_file_name}, year={get_activity_year(activity)}."
                     )
                 continue
 
-            if not matches_filter_types(activity, args.filter_types):
-                if args.verbose:
-                    print(f'Skipping {activity_file_name}, type={activity["type"]}.')
+            if zip_file:
+                file_exists = activity.filename in zip_file_names
+            else:
+                dir_name, file_name = os.path.split(activity.filename)
+                if dir_name not in export_dir_file_names:
+                    export_dir_file_names[dir_name] = list_file_names(
+                        activity_dir_prefix + dir_name
+                    )
+                file_exists = file_name in export_dir_file_names[dir_name]
+                if not file_exists:
+                    # Ask the filesystem on a miss, it may ignore the case of
+                    # names that differ between activities.csv and the export
+                    file_exists = os.path.exists(activity_file_name)
+            if not file_exists:
+                print(f"Activity file not found: {activity_file_name}\n")
                 continue
 
-            gpx_file_name = (
-                f"{activity['date']}_{activity['type']}_{activity['id']}.gpx"
+            activity_file_names.append(activity_file_name)
+            gpx_file_paths.append(
+                f"{output_dir_prefix}{activity.date}_{activity.type}_{activity.id}.gpx"
             )
-            gpx_file_path = os.path.join(args.output_dir, gpx_file_name)
 
-            if args.verbose:
-                print(f"Converting {activity_file_name} to {gpx_file_path}.")
-            if zip_file:
-                with tempfile.NamedTemporaryFile(
-                    suffix=os.path.basename(activity_file_name)
-                ) as unzipped_file:
-                    zip_extract(zip_file, activity_file_name, unzipped_file)
-                    convert_activity(unzipped_file.name, gpx_file_path)
-            else:
-                convert_activity(activity_file_name, gpx_file_path)
+        # Activities are independent of each other, so prepare them in parallel
+        # and then convert them with as few gpsbabel invocations as possible
+        workers = os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(args.strava_export if zip_file else None,),
+        ) as executor:
+            gpsbabel_file_paths: Dict[str, List[Tuple[str, str]]] = {
+                file_type: [] for file_type in GPSBABEL_FILE_TYPE
+            }
+            for job in executor.map(
+                functools.partial(prepare_export_activity, verbose=args.verbose),
+                activity_file_names,
+                gpx_file_paths,
+                chunksize=8,
+            ):
+                if job:
+                    file_type, input_file_path, output_file_path = job
+                    gpsbabel_file_paths[file_type].append(
+                        (input_file_path, output_file_path)
+                    )
+
+            batch_file_types = []
+            batch_file_paths = []
+            for file_type, file_paths in gpsbabel_file_paths.items():
+                # Spread small exports over all workers as well
+                batch_size = max(
+                    1, min(GPSBABEL_BATCH_SIZE, -(-len(file_paths) // workers))
+                )
+                for i in range(0, len(file_paths), batch_size):
+                    batch_file_types.append(file_type)
+                    batch_file_paths.append(file_paths[i : i + batch_size])
+            list(
+                executor.map(gpsbabel_batch_convert, batch_file_types, batch_file_paths)
+            )
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()